@@ -1,37 +1,194 @@
 
 # core/admin.py
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import ShowFacets
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Exists, OuterRef
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
 from .models import Client, ClientMembership, TfarRecord, UserProfile, TfarUpload, TfarExport
 
+
+# ---------- Changelist helpers for large tables ----------
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that reads the planner's row estimate (pg_class.reltuples)
+    for unfiltered PostgreSQL changelists instead of running COUNT(*).
+    Filtered querysets, small tables and other backends use the exact count.
+    """
+    estimate_threshold = 100_000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        connection = connections[qs.db]
+        if connection.vendor == "postgresql" and not qs.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [qs.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 (or 0) until the table has been analyzed
+            if row and row[0] >= self.estimate_threshold:
+                return int(row[0])
+        return super().count
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    Text-box list filter with suggestions from the admin autocomplete view.
+    Never enumerates the related table, so the sidebar stays cheap however
+    many clients/users exist. Subclasses set `field_name` (the FK on the
+    filtered model) and `lookup` (a unique text field on the related model).
+    """
+    template = "admin/core/autocomplete_filter.html"
+    field_name = None
+    lookup = None
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.app_label = model._meta.app_label
+        self.model_name = model._meta.model_name
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.lookup: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            "selected": self.value() is None,
+            "query_string": changelist.get_query_string(remove=[self.parameter_name]),
+            "display": _("All"),
+            "params": [(k, v) for k, v in changelist.params.items() if k != self.parameter_name],
+        }
+
+
+class ClientFilter(AutocompleteFilter):
+    title = _("client")
+    parameter_name = "client"
+    field_name = "client"
+    lookup = "client__name"
+
+
+class OwnerFilter(AutocompleteFilter):
+    title = _("owner")
+    parameter_name = "owner"
+    field_name = "owner"
+    lookup = "owner__username"
+
+
+class UploadedByFilter(AutocompleteFilter):
+    title = _("uploaded by")
+    parameter_name = "uploaded_by"
+    field_name = "uploaded_by"
+    lookup = "uploaded_by__username"
+
+
+class ExportedByFilter(AutocompleteFilter):
+    title = _("exported by")
+    parameter_name = "exported_by"
+    field_name = "exported_by"
+    lookup = "exported_by__username"
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Shared changelist settings for tables that grow to millions of rows."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = ShowFacets.NEVER
+    list_per_page = 50
+
+
+# ---------- Model admins ----------
+
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
     list_display = ("name",)
     search_fields = ("name",)
+    ordering = ("name",)
 
 @admin.register(ClientMembership)
 class ClientMembershipAdmin(admin.ModelAdmin):
     list_display = ("user", "client", "role")
-    list_filter = ("role", "client")
+    list_filter = ("role", ClientFilter)
+    list_select_related = ("user", "client")
+    autocomplete_fields = ("user", "client")
     search_fields = ("user__username", "client__name")
 
 @admin.register(TfarRecord)
-class TfarRecordAdmin(admin.ModelAdmin):
+class TfarRecordAdmin(LargeTableAdmin):
     list_display = ("asset_id", "client", "owner", "uploaded_at", "purchase_cost", "closing_wdv")
-    list_filter = ("client", "depreciation_method")
+    list_filter = (ClientFilter, OwnerFilter, "depreciation_method")
+    list_select_related = ("client", "owner")
+    autocomplete_fields = ("client", "owner")
+    raw_id_fields = ("upload",)
+    date_hierarchy = "uploaded_at"
     search_fields = ("asset_id", "asset_description")
 
+    # keep dashboard caches (keyed on Client.data_version) in step with admin edits
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        client_ids = {obj.client_id}
+        if change and form.initial.get("client"):
+            client_ids.add(form.initial["client"])  # row moved away from its old client
+        Client.bump_data_version(client_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Client.bump_data_version([obj.client_id])
+
+    def delete_queryset(self, request, queryset):
+        client_ids = list(queryset.values_list("client_id", flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        Client.bump_data_version(client_ids)
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ("user", "user_type")
+    list_select_related = ("user",)
 
 @admin.register(TfarUpload)
-class TfarUploadAdmin(admin.ModelAdmin):
+class TfarUploadAdmin(LargeTableAdmin):
     list_display = ("client", "uploaded_by", "original_filename", "row_count", "source_ip", "created_at")
-    list_filter = ("client", "uploaded_by")
+    list_filter = (ClientFilter, UploadedByFilter)
+    list_select_related = ("client", "uploaded_by")
+    autocomplete_fields = ("client", "uploaded_by")
+    date_hierarchy = "created_at"
     search_fields = ("original_filename",)
+    actions = ("delete_upload_records",)
+
+    def has_delete_records_permission(self, request):
+        return request.user.has_perm("core.delete_tfarrecord")
+
+    @admin.action(description="Delete TFAR records from selected uploads", permissions=["delete_records"])
+    def delete_upload_records(self, request, queryset):
+        # uploads made before records were linked to their upload have nothing to delete here
+        unlinked = queryset.filter(~Exists(TfarRecord.objects.filter(upload=OuterRef("pk")))).count()
+        # single set-based DELETE; TfarRecord has no dependents or delete signals
+        deleted, _per_model = TfarRecord.objects.filter(upload__in=queryset.values("pk")).delete()
+        Client.bump_data_version(queryset.values("client_id"))
+        if deleted:
+            self.message_user(request, f"Deleted {deleted} TFAR records.", messages.SUCCESS)
+        if unlinked:
+            self.message_user(request, f"{unlinked} of the selected uploads have no linked TFAR records "
+                              "(uploads made before records were linked to their upload, or already deleted); "
+                              "remove those rows from the TFAR records list instead.", messages.WARNING)
 
 @admin.register(TfarExport)
-class TfarExportAdmin(admin.ModelAdmin):
+class TfarExportAdmin(LargeTableAdmin):
     list_display = ("client", "exported_by", "filename", "row_count", "created_at")
-    list_filter = ("client", "exported_by")
+    list_filter = (ClientFilter, ExportedByFilter)
+    list_select_related = ("client", "exported_by")
+    autocomplete_fields = ("client", "exported_by")
+    date_hierarchy = "created_at"
     search_fields = ("filename",)
@@ -0,0 +1,289 @@
+
+# core/audit.py
+"""
+Buffered audit writer.
+
+Request code calls `record_event(TfarExport, client_id=..., ...)`; the event is
+stamped with the current time, appended to a per-process spool file (JSON
+lines) and buffered in memory. A background thread bulk-inserts the buffer
+into the audit models when it reaches AUDIT_FLUSH_SIZE events or every
+AUDIT_FLUSH_INTERVAL seconds, and once more at interpreter exit. After a
+successful flush the spool is truncated; spools left behind by a crashed
+process are replayed by the next writer that starts in the same
+AUDIT_SPOOL_DIR. Delivery is at-least-once: a crash between the bulk insert
+and the spool truncate replays that batch.
+
+`created_at` is written from the time recorded in `record()`, so rows keep
+the event time however late they are flushed or replayed.
+
+If a bulk insert is rejected (e.g. an event for a client deleted before the
+flush) the batch is retried row by row; rows that still fail with a data
+error or a bad payload (POISON_ERRORS) are moved to
+AUDIT_SPOOL_DIR/dead-letter.jsonl and logged so they can't block the rest.
+Any other error keeps the unwritten events buffered for the next flush.
+"""
+import atexit, fcntl, glob, json, logging, os, socket, threading, uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+
+
+class _Transient(Exception):
+    """Flush failed for reasons unrelated to the events themselves (DB down etc.)."""
+
+
+# Errors caused by the event itself, which will never succeed on retry: DB
+# data errors, plus what _build raises for a bad payload (unknown model,
+# unknown field, unparseable value). Anything else (OperationalError,
+# InterfaceError on a closed connection, ...) is treated as transient.
+POISON_ERRORS = (IntegrityError, DataError, LookupError, TypeError, ValueError)
+
+
+def _is_poison(exc):
+    return isinstance(exc, POISON_ERRORS)
+
+
+class AuditWriter:
+    def __init__(self):
+        self._lock = threading.Lock()        # guards buffer + spool file
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._buffer = []
+        self._spool = None
+        self._pid = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    # ---- setup ----
+
+    def _spool_path(self, suffix=""):
+        # hostname keeps pids from different containers sharing the dir apart
+        return os.path.join(settings.AUDIT_SPOOL_DIR, f"audit-{socket.gethostname()}-{os.getpid()}{suffix}.jsonl")
+
+    def _read_spool(self, fh):
+        events = []
+        for line in fh:
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # torn final line from a crash mid-write; the event never completed
+                logger.warning("Skipping unreadable audit spool line in %s", fh.name)
+        return events
+
+    def _after_fork(self):
+        """Child: drop the parent's spool handle (and its flock) and start afresh on first use."""
+        if self._spool is not None:
+            self._spool.close()
+        self._spool = None
+        self._pid = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def _ensure_started(self):
+        """Open this process's spool and start the flusher."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._start()
+
+    def _open_spool(self):
+        """Open and lock a spool nobody else owns; never blocks a request thread."""
+        path = self._spool_path()
+        while True:
+            fh = open(path, "a+", encoding="utf-8")
+            try:
+                # held for the life of the process: marks the spool as owned
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fh.close()
+                path = self._spool_path(f"-{uuid.uuid4().hex[:8]}")
+                continue
+            # between open() and flock() another process's _recover_orphans may
+            # have locked the new empty file and unlinked it; never spool into
+            # an unlinked inode
+            try:
+                if os.fstat(fh.fileno()).st_ino == os.stat(path).st_ino:
+                    return fh
+            except FileNotFoundError:
+                pass
+            fh.close()
+
+    def _start(self):
+        os.makedirs(settings.AUDIT_SPOOL_DIR, exist_ok=True)
+        self._spool = self._open_spool()
+        # a reused name may hold events from a dead process; they are already on disk
+        self._spool.seek(0)
+        self._buffer = self._read_spool(self._spool)
+        self._pid = os.getpid()
+        self._recover_orphans()
+        threading.Thread(target=self._run, name="audit-writer", daemon=True).start()
+        atexit.register(self.close)
+
+    def _recover_orphans(self):
+        """Adopt events from spools whose owning process is gone (lock is free)."""
+        for path in glob.glob(os.path.join(settings.AUDIT_SPOOL_DIR, "audit-*.jsonl")):
+            if path == self._spool.name:
+                continue
+            try:
+                with open(path, "r+", encoding="utf-8") as fh:
+                    try:
+                        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # live writer
+                    events = self._read_spool(fh)
+                    self._append(events)
+                    os.remove(path)
+                if events:
+                    logger.info("Recovered %d audit events from %s", len(events), path)
+            except OSError:
+                logger.exception("Could not recover audit spool %s", path)
+
+    # ---- write path ----
+
+    def _append(self, events):
+        """Caller holds no lock; spool first, then buffer."""
+        if not events:
+            return
+        with self._lock:
+            self._spool.write("".join(json.dumps(e) + "\n" for e in events))
+            self._spool.flush()
+            if settings.AUDIT_SPOOL_FSYNC:
+                os.fsync(self._spool.fileno())
+            self._buffer.extend(events)
+            full = len(self._buffer) >= settings.AUDIT_FLUSH_SIZE
+        if full:
+            self._wake.set()
+
+    def record(self, model, **fields):
+        """Queue one row for `model`; `fields` must be JSON-serialisable (use FK *_id)."""
+        self._ensure_started()
+        self._append([{"model": model._meta.label, "fields": fields, "ts": timezone.now().isoformat()}])
+
+    # ---- flush path ----
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.AUDIT_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Audit flush failed; will retry")
+            finally:
+                close_old_connections()
+
+    def _build(self, event):
+        model = apps.get_model(event["model"])
+        fields = dict(event["fields"])
+        if "ts" in event and "created_at" not in fields and any(f.name == "created_at" for f in model._meta.fields):
+            fields["created_at"] = parse_datetime(event["ts"])
+        return model(**fields)
+
+    def _insert_bulk(self, batch):
+        by_model = {}
+        for e in batch:
+            obj = self._build(e)
+            by_model.setdefault(type(obj), []).append(obj)
+        with transaction.atomic():
+            for model, objs in by_model.items():
+                model.objects.bulk_create(objs, batch_size=500)
+
+    def _insert_rows(self, batch):
+        """Row-by-row fallback. Returns rejected events; raises _Transient with the unwritten rest."""
+        dead = []
+        for i, e in enumerate(batch):
+            try:
+                with transaction.atomic():
+                    self._build(e).save(force_insert=True)
+            except Exception as exc:
+                if not _is_poison(exc):
+                    # keep what was already rejected; the caller only re-buffers batch[i:]
+                    if dead:
+                        self._dead_letter(dead)
+                    raise _Transient(batch[i:]) from exc
+                logger.error("Dropping audit event to dead letter (%s): %s", exc, e)
+                dead.append(e)
+        return dead
+
+    def _dead_letter(self, events):
+        path = os.path.join(settings.AUDIT_SPOOL_DIR, DEAD_LETTER_FILE)
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write("".join(json.dumps(e) + "\n" for e in events))
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            try:
+                try:
+                    self._insert_bulk(batch)
+                except Exception as exc:
+                    if not _is_poison(exc):
+                        raise _Transient(batch) from exc
+                    logger.warning("Audit bulk insert rejected (%s); retrying %d events row by row", exc, len(batch))
+                    dead = self._insert_rows(batch)
+                    if dead:
+                        self._dead_letter(dead)
+            except _Transient as t:
+                unwritten = t.args[0]
+                with self._lock:
+                    self._buffer[:0] = unwritten
+                    if len(unwritten) < len(batch):
+                        self._rewrite_spool()  # drop rows already inserted row by row
+                raise t.__cause__
+            with self._lock:
+                # spool now only needs whatever arrived during the flush
+                self._rewrite_spool()
+
+    def _rewrite_spool(self):
+        """Caller holds self._lock."""
+        self._spool.seek(0)
+        self._spool.truncate()
+        self._spool.write("".join(json.dumps(e) + "\n" for e in self._buffer))
+        self._spool.flush()
+        if settings.AUDIT_SPOOL_FSYNC:
+            os.fsync(self._spool.fileno())
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        atexit.unregister(self.close)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Audit flush at shutdown failed; events stay in %s", self._spool.name)
+            return
+        with self._lock:
+            if not self._buffer:
+                os.remove(self._spool.name)
+            self._spool.close()
+            self._pid = None
+
+
+_writer = AuditWriter()
+
+
+def record_event(model, **fields):
+    _writer.record(model, **fields)
+
+
+def flush():
+    _writer.flush()
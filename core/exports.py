@@ -0,0 +1,168 @@
+
+# core/exports.py
+"""
+Consolidated multi-client export bundle.
+
+Each client's register is written to temporary CSV/XLSX files by a pool of
+worker threads; the main thread streams the finished files into a ZIP
+(zip64, data descriptors) as they become ready, so neither the archive nor
+any single register is held in memory. At most 2 x TFAR_EXPORT_WORKERS
+clients are queued or finished-but-unsent at once, bounding temp disk use.
+
+The workers are threads, so only the DB fetches overlap; CSV/openpyxl
+serialisation is pure Python and runs under the GIL. The gain is bounded by
+how much of a client's export time is spent waiting on the database.
+Threads are kept because a process pool would need a fresh Django setup
+and DB connection in every child.
+
+A big bundle can stream for longer than gunicorn's --timeout. Only gthread
+workers (see the Dockerfile) keep heart-beating while a request runs; a sync
+worker would be killed partway through the download.
+"""
+import csv, itertools, os, shutil, tempfile, time, zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import connection
+from django.utils.text import get_valid_filename
+
+from .audit import record_event
+from .models import TfarRecord, TfarExport
+
+# Model fields in the same order as views.REQUIRED_HEADERS
+RECORD_FIELDS = [
+    "asset_id", "asset_description", "tax_start_date", "depreciation_method",
+    "purchase_cost", "tax_effective_life", "opening_cost",
+    "opening_accum_depreciation", "opening_wdv",
+    "addition", "disposal", "tax_depreciation",
+    "closing_cost", "closing_accum_depreciation", "closing_wdv",
+]
+SUMMARY_HEADERS = ["client", "rows", "purchase cost", "tax depreciation", "closing wdv", "csv file", "xlsx file"]
+COPY_CHUNK = 64 * 1024
+
+
+class _ZipStream:
+    """Write-only, unseekable file object; zipfile writes into it and the generator drains it."""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        chunks, self._chunks = self._chunks, []
+        return b"".join(chunks)
+
+
+def _bundle_names(clients):
+    """Filesystem-safe, unique base name per client."""
+    names, seen = [], set()
+    for c in clients:
+        try:
+            base = get_valid_filename(c.name)
+        except SuspiciousFileOperation:
+            base = f"client_{c.id}"
+        if base.lower() in seen:
+            base = f"{base}_{c.id}"
+        seen.add(base.lower())
+        names.append(base)
+    return names
+
+
+def _write_client_files(client, base, headers, workdir, index):
+    """Worker: write one client's CSV and XLSX to `workdir` and return its summary."""
+    csv_path = os.path.join(workdir, f"{index}.csv")
+    xlsx_path = os.path.join(workdir, f"{index}.xlsx")
+    result = {"client": client, "base": base, "csv_path": csv_path, "xlsx_path": xlsx_path,
+              "rows": 0, "purchase_cost": 0, "tax_depreciation": 0, "closing_wdv": 0}
+    from openpyxl import Workbook
+    try:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title=base[:31])
+        ws.append(["client"] + headers)
+        qs = TfarRecord.objects.filter(client=client).order_by("asset_id").values_list(*RECORD_FIELDS)
+        with open(csv_path, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["client"] + headers)
+            for row in qs.iterator(chunk_size=2000):
+                writer.writerow([client.name, row[0], row[1], row[2].isoformat(), *row[3:]])
+                ws.append([client.name, *row])
+                result["rows"] += 1
+                result["purchase_cost"] += row[4]
+                result["tax_depreciation"] += row[11]
+                result["closing_wdv"] += row[14]
+        wb.save(xlsx_path)
+        return result
+    finally:
+        # worker threads get their own DB connection; don't leak it
+        connection.close()
+
+
+def _write_summary(results, path):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title="Summary")
+    ws.append(SUMMARY_HEADERS)
+    for r in results:
+        ws.append([r["client"].name, r["rows"], r["purchase_cost"], r["tax_depreciation"],
+                   r["closing_wdv"], f"{r['base']}.csv", f"{r['base']}.xlsx"])
+    ws.append(["TOTAL", sum(r["rows"] for r in results), sum(r["purchase_cost"] for r in results),
+               sum(r["tax_depreciation"] for r in results), sum(r["closing_wdv"] for r in results)])
+    wb.save(path)
+
+
+def _zip_file(zf, stream, src_path, arcname, compress_type):
+    info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+    info.compress_type = compress_type
+    with open(src_path, "rb") as src, zf.open(info, "w", force_zip64=True) as dest:
+        while chunk := src.read(COPY_CHUNK):
+            dest.write(chunk)
+            yield stream.drain()
+    yield stream.drain()
+
+
+def stream_export_bundle(clients, user, headers, bundle_name):
+    """
+    Yield the bytes of a ZIP holding `<client>.csv` and `<client>.xlsx` for every
+    client plus `summary.xlsx`, writing one TfarExport audit row per client.
+    """
+    workdir = tempfile.mkdtemp(prefix="tfar_bundle_")
+    pool = ThreadPoolExecutor(max_workers=settings.TFAR_EXPORT_WORKERS)
+    stream = _ZipStream()
+    results = []
+    try:
+        jobs = enumerate(zip(clients, _bundle_names(clients)))
+        pending = deque()
+
+        def submit_next():
+            for i, (c, base) in itertools.islice(jobs, 1):
+                pending.append(pool.submit(_write_client_files, c, base, headers, workdir, i))
+
+        # bounded read-ahead: a slow download must not spool the whole bundle to disk
+        for _ in range(2 * settings.TFAR_EXPORT_WORKERS):
+            submit_next()
+        with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            # stream in submission (client name) order while the next clients are being built
+            while pending:
+                r = pending.popleft().result()
+                yield from _zip_file(zf, stream, r["csv_path"], f"{r['base']}.csv", zipfile.ZIP_DEFLATED)
+                yield from _zip_file(zf, stream, r["xlsx_path"], f"{r['base']}.xlsx", zipfile.ZIP_STORED)
+                os.remove(r["csv_path"]); os.remove(r["xlsx_path"])
+                submit_next()
+                results.append(r)
+                # audit trail: one TfarExport per client written to the bundle
+                record_event(TfarExport, client_id=r["client"].id, exported_by_id=user.id,
+                             filename=f"{bundle_name}/{r['base']}.csv"[:255], row_count=r["rows"])
+            summary_path = os.path.join(workdir, "summary.xlsx")
+            _write_summary(results, summary_path)
+            yield from _zip_file(zf, stream, summary_path, "summary.xlsx", zipfile.ZIP_DEFLATED)
+        yield stream.drain()  # central directory
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,29 @@
+
+# core/management/commands/bootstrap.py
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ("One-off deployment setup, run after `migrate` and before the app server starts. "
+            "Creates the initial superuser from DJANGO_SU_NAME/EMAIL/PASSWORD if no users exist.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+
+        su_name = os.getenv("DJANGO_SU_NAME")
+        su_email = os.getenv("DJANGO_SU_EMAIL")
+        su_password = os.getenv("DJANGO_SU_PASSWORD")
+
+        # Only attempt if env vars are provided
+        if not (su_name and su_email and su_password):
+            self.stdout.write("DJANGO_SU_* not set; skipping superuser creation.")
+            return
+        # If at least one user exists, do nothing
+        if User.objects.exists():
+            self.stdout.write("Users already exist; skipping superuser creation.")
+            return
+        User.objects.create_superuser(username=su_name, email=su_email, password=su_password)
+        self.stdout.write(self.style.SUCCESS(f"Created superuser '{su_name}'."))
@@ -0,0 +1,56 @@
+# core/migrations/0004_record_upload_and_uploaded_idx.py
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """CREATE INDEX CONCURRENTLY on PostgreSQL (no write lock on tfarrecord); plain AddIndex elsewhere (dev sqlite)."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("core", "0003_audit_models"),
+    ]
+
+    operations = [
+        # The FK's index is built concurrently below instead of by AddField,
+        # which would CREATE INDEX while holding a lock on the whole table.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name="tfarrecord",
+                    name="upload",
+                    field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to="core.tfarupload"),
+                ),
+            ],
+            database_operations=[
+                migrations.AddField(
+                    model_name="tfarrecord",
+                    name="upload",
+                    field=models.ForeignKey(blank=True, null=True, db_index=False, on_delete=django.db.models.deletion.SET_NULL, to="core.tfarupload"),
+                ),
+                AddIndexConcurrentlyOnPostgres(
+                    model_name="tfarrecord",
+                    index=models.Index(fields=["upload"], name="core_tfarrecord_upload_idx"),
+                ),
+            ],
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="tfarrecord",
+            index=models.Index(fields=["uploaded_at"], name="core_record_uploaded_idx"),
+        ),
+    ]
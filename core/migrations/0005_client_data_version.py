@@ -0,0 +1,16 @@
+# core/migrations/0005_client_data_version.py
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_record_upload_and_uploaded_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="client",
+            name="data_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
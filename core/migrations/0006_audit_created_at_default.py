@@ -0,0 +1,24 @@
+# core/migrations/0006_audit_created_at_default.py
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0005_client_data_version"),
+    ]
+
+    # auto_now_add overwrote the value on insert; the buffered audit writer
+    # sets created_at to the event time explicitly.
+    operations = [
+        migrations.AlterField(
+            model_name="tfarupload",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name="tfarexport",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -2,13 +2,20 @@
 # core/models.py
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 class Client(models.Model):
     name = models.CharField(max_length=150, unique=True)
+    # bumped whenever the client's TFAR rows change; part of the dashboard cache key
+    data_version = models.PositiveIntegerField(default=0)
     def __str__(self):
         return self.name
 
+    @classmethod
+    def bump_data_version(cls, client_ids):
+        cls.objects.filter(id__in=client_ids).update(data_version=models.F("data_version") + 1)
+
 
 class ClientMembership(models.Model):
     ROLE_CHOICES = (
@@ -37,6 +44,8 @@ class UserProfile(models.Model):
 class TfarRecord(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
+    # upload batch that created the row; lets admin act on one upload set-wise
+    upload = models.ForeignKey("TfarUpload", null=True, blank=True, on_delete=models.SET_NULL)
 
     # 15 TFAR fields
     asset_id = models.CharField(max_length=50)
@@ -60,6 +69,7 @@ class TfarRecord(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["client", "owner", "asset_id"], name="core_client_owner_asset_idx"),
+            models.Index(fields=["uploaded_at"], name="core_record_uploaded_idx"),
         ]
 
     def __str__(self):
@@ -75,7 +85,7 @@ class TfarUpload(models.Model):
     row_count = models.IntegerField(default=0)
     source_ip = models.CharField(max_length=64, blank=True, default="")  # proxy-safe best effort
     checksum = models.CharField(max_length=128, blank=True, default="")  # optional SHA256 of file
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)  # event time, kept by core.audit
 
     class Meta:
         indexes = [models.Index(fields=["client", "uploaded_by", "created_at"])]
@@ -89,7 +99,7 @@ class TfarExport(models.Model):
     exported_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     filename = models.CharField(max_length=255)
     row_count = models.IntegerField(default=0)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)  # event time, kept by core.audit
 
     class Meta:
         indexes = [models.Index(fields=["client", "exported_by", "created_at"])]
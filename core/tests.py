@@ -0,0 +1,434 @@
+
+# core/tests.py
+import csv, datetime, fcntl, io, json, os, shutil, tempfile, zipfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import InterfaceError, OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from openpyxl import Workbook
+
+from . import audit
+from .admin import EstimatedCountPaginator
+from .audit import AuditWriter, DEAD_LETTER_FILE
+from .exports import stream_export_bundle
+from .models import Client, ClientMembership, TfarExport, TfarRecord, TfarUpload
+from .views import REQUIRED_HEADERS
+
+AMOUNT_FIELDS = [
+    "purchase_cost", "tax_effective_life", "opening_cost", "opening_accum_depreciation", "opening_wdv",
+    "addition", "disposal", "tax_depreciation", "closing_cost", "closing_accum_depreciation", "closing_wdv",
+]
+
+
+def make_records(client, owner, asset_ids, upload=None, amount=1):
+    return TfarRecord.objects.bulk_create([
+        TfarRecord(owner=owner, client=client, upload=upload, asset_id=asset_id, asset_description="Laptop",
+                   tax_start_date=datetime.date(2024, 7, 1), depreciation_method="DV",
+                   **{f: amount for f in AMOUNT_FIELDS})
+        for asset_id in asset_ids
+    ])
+
+
+class _FakePostgres:
+    """Stands in for a PostgreSQL connection: returns `estimate` from pg_class.reltuples."""
+    vendor = "postgresql"
+
+    def __init__(self, estimate):
+        self.estimate = estimate
+        self.executed = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return (self.estimate,)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("preparer", password="x")
+        self.acme = Client.objects.create(name="Acme")
+        make_records(self.acme, owner, ["A1", "A2", "A3"])
+
+    def paginator(self, qs, estimate):
+        fake = _FakePostgres(estimate)
+        patcher = mock.patch("core.admin.connections", {"default": fake})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return EstimatedCountPaginator(qs, 10), fake
+
+    def test_unfiltered_large_table_uses_reltuples(self):
+        paginator, fake = self.paginator(TfarRecord.objects.order_by("pk"), 5_000_000)
+        self.assertEqual(paginator.count, 5_000_000)
+        self.assertEqual(fake.executed[0][1], ["core_tfarrecord"])
+
+    def test_small_or_unanalyzed_table_uses_exact_count(self):
+        for estimate in (EstimatedCountPaginator.estimate_threshold - 1, -1):
+            paginator, _fake = self.paginator(TfarRecord.objects.order_by("pk"), estimate)
+            self.assertEqual(paginator.count, 3)
+
+    def test_filtered_queryset_uses_exact_count(self):
+        paginator, fake = self.paginator(TfarRecord.objects.filter(asset_id="A1").order_by("pk"), 5_000_000)
+        self.assertEqual(paginator.count, 1)
+        self.assertEqual(fake.executed, [])
+
+    def test_other_backends_use_exact_count(self):
+        self.assertEqual(EstimatedCountPaginator(TfarRecord.objects.order_by("pk"), 10).count, 3)
+
+
+# admin pages link static files; the manifest storage needs collectstatic, so tests use the plain one
+PLAIN_STATIC = override_settings(STORAGES={
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
+
+
+@PLAIN_STATIC
+class TfarAdminTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin_user = User.objects.create_superuser("admin", "admin@example.com", "x")
+        self.alice = User.objects.create_user("alice", password="x")
+        self.acme = Client.objects.create(name="Acme")
+        self.beta = Client.objects.create(name="Beta")
+        self.client.force_login(self.admin_user)
+
+    def test_client_and_owner_filters(self):
+        make_records(self.acme, self.alice, ["ACME-1"])
+        make_records(self.beta, self.admin_user, ["BETA-1"])
+
+        response = self.client.get("/admin/core/tfarrecord/", {"client": "Acme"})
+        self.assertContains(response, "ACME-1")
+        self.assertNotContains(response, "BETA-1")
+        self.assertContains(response, "data-autocomplete-url")
+
+        response = self.client.get("/admin/core/tfarrecord/", {"owner": "admin"})
+        self.assertContains(response, "BETA-1")
+        self.assertNotContains(response, "ACME-1")
+
+    def test_delete_upload_records_action(self):
+        upload = TfarUpload.objects.create(client=self.acme, uploaded_by=self.alice, original_filename="a.xlsx")
+        make_records(self.acme, self.alice, ["LINKED-1", "LINKED-2"], upload=upload)
+        make_records(self.acme, self.alice, ["OTHER-1"])
+
+        response = self.client.post("/admin/core/tfarupload/", {
+            "action": "delete_upload_records", "_selected_action": [upload.pk]}, follow=True)
+
+        self.assertEqual(list(TfarRecord.objects.values_list("asset_id", flat=True)), ["OTHER-1"])
+        self.assertContains(response, "Deleted 2 TFAR records.")
+        self.acme.refresh_from_db()
+        self.assertEqual(self.acme.data_version, 1)
+
+    def test_delete_upload_records_warns_for_unlinked_uploads(self):
+        legacy = TfarUpload.objects.create(client=self.acme, uploaded_by=self.alice, original_filename="old.xlsx")
+        make_records(self.acme, self.alice, ["LEGACY-1"])  # upload=NULL, as before migration 0004
+
+        response = self.client.post("/admin/core/tfarupload/", {
+            "action": "delete_upload_records", "_selected_action": [legacy.pk]}, follow=True)
+
+        self.assertEqual(TfarRecord.objects.count(), 1)
+        self.assertNotContains(response, "Deleted 0 TFAR records.")
+        self.assertContains(response, "1 of the selected uploads have no linked TFAR records")
+
+
+class AuditWriterTests(TransactionTestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp(prefix="tfar_audit_test_")
+        self.addCleanup(shutil.rmtree, self.spool_dir, ignore_errors=True)
+        overrides = override_settings(AUDIT_SPOOL_DIR=self.spool_dir, AUDIT_FLUSH_INTERVAL=3600)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = get_user_model().objects.create_user("preparer", password="x")
+        self.client_obj = Client.objects.create(name="Acme")
+        self.writer = AuditWriter()
+        self.addCleanup(self.writer.close)
+
+    def export_fields(self, filename, client_id=None):
+        return {"client_id": client_id or self.client_obj.id, "exported_by_id": self.user.id,
+                "filename": filename, "row_count": 1}
+
+    def spool_lines(self):
+        with open(self.writer._spool.name, encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh if line.strip()]
+
+    def test_flush_writes_rows_and_truncates_spool(self):
+        self.writer.record(TfarExport, **self.export_fields("a.csv"))
+        self.writer.record(TfarExport, **self.export_fields("b.csv"))
+        self.assertEqual(len(self.spool_lines()), 2)
+
+        self.writer.flush()
+
+        self.assertEqual(sorted(TfarExport.objects.values_list("filename", flat=True)), ["a.csv", "b.csv"])
+        self.assertEqual(self.spool_lines(), [])
+
+    def test_poison_event_goes_to_dead_letter_and_does_not_block_others(self):
+        self.writer.record(TfarExport, **self.export_fields("poison.csv", client_id=999999))
+        self.writer.record(TfarExport, **self.export_fields("good.csv"))
+
+        self.writer.flush()
+
+        self.assertEqual(list(TfarExport.objects.values_list("filename", flat=True)), ["good.csv"])
+        self.assertEqual(self.spool_lines(), [])
+        with open(os.path.join(self.spool_dir, DEAD_LETTER_FILE), encoding="utf-8") as fh:
+            dead = [json.loads(line) for line in fh]
+        self.assertEqual([e["fields"]["filename"] for e in dead], ["poison.csv"])
+
+        # later events keep flowing
+        self.writer.record(TfarExport, **self.export_fields("next.csv"))
+        self.writer.flush()
+        self.assertTrue(TfarExport.objects.filter(filename="next.csv").exists())
+
+    def test_transient_failure_keeps_batch_buffered(self):
+        self.writer.record(TfarExport, **self.export_fields("a.csv"))
+        with mock.patch.object(TfarExport.objects, "bulk_create", side_effect=OperationalError("db down")):
+            with self.assertRaises(OperationalError):
+                self.writer.flush()
+
+        self.assertEqual(len(self.spool_lines()), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.spool_dir, DEAD_LETTER_FILE)))
+        self.writer.flush()
+        self.assertTrue(TfarExport.objects.filter(filename="a.csv").exists())
+
+    def test_connection_error_is_transient_not_poison(self):
+        # InterfaceError is not a DatabaseError subclass; it must not dead-letter the batch
+        self.writer.record(TfarExport, **self.export_fields("a.csv"))
+        with mock.patch.object(TfarExport.objects, "bulk_create", side_effect=InterfaceError("connection already closed")):
+            with self.assertRaises(InterfaceError):
+                self.writer.flush()
+
+        self.assertEqual(len(self.spool_lines()), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.spool_dir, DEAD_LETTER_FILE)))
+
+    def test_poison_then_connection_failure_keeps_both(self):
+        self.writer.record(TfarExport, **self.export_fields("poison.csv", client_id=999999))
+        self.writer.record(TfarExport, **self.export_fields("good.csv"))
+        save = TfarExport.save
+
+        def save_until_db_drops(obj, *args, **kwargs):
+            if obj.filename == "good.csv":
+                raise OperationalError("server closed the connection")
+            return save(obj, *args, **kwargs)
+
+        with mock.patch.object(TfarExport, "save", autospec=True, side_effect=save_until_db_drops):
+            with self.assertRaises(OperationalError):
+                self.writer.flush()
+
+        with open(os.path.join(self.spool_dir, DEAD_LETTER_FILE), encoding="utf-8") as fh:
+            self.assertEqual([json.loads(line)["fields"]["filename"] for line in fh], ["poison.csv"])
+        self.assertEqual([e["fields"]["filename"] for e in self.spool_lines()], ["good.csv"])
+
+        self.writer.flush()
+        self.assertEqual(list(TfarExport.objects.values_list("filename", flat=True)), ["good.csv"])
+
+    def test_created_at_is_event_time_not_flush_time(self):
+        event_time = datetime.datetime(2024, 7, 1, 9, 30, tzinfo=datetime.timezone.utc)
+        with mock.patch("django.utils.timezone.now", return_value=event_time):
+            self.writer.record(TfarExport, **self.export_fields("a.csv"))
+
+        self.writer.flush()
+
+        self.assertEqual(TfarExport.objects.get().created_at, event_time)
+
+    def test_orphan_spool_from_crashed_process_is_replayed(self):
+        orphan = os.path.join(self.spool_dir, "audit-deadhost-4242.jsonl")
+        event = {"model": "core.TfarExport", "fields": self.export_fields("crashed.csv"),
+                 "ts": "2024-07-01T09:30:00+00:00"}
+        with open(orphan, "w", encoding="utf-8") as fh:
+            fh.write(json.dumps(event) + "\n")
+            fh.write('{"model": "core.TfarExp')  # torn last line from the crash
+
+        self.writer.record(TfarExport, **self.export_fields("fresh.csv"))
+        self.writer.flush()
+
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(sorted(TfarExport.objects.values_list("filename", flat=True)), ["crashed.csv", "fresh.csv"])
+        self.assertEqual(TfarExport.objects.get(filename="crashed.csv").created_at,
+                         datetime.datetime(2024, 7, 1, 9, 30, tzinfo=datetime.timezone.utc))
+
+    def test_live_spool_is_not_adopted(self):
+        live = os.path.join(self.spool_dir, "audit-otherhost-4242.jsonl")
+        with open(live, "w", encoding="utf-8") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            fh.write(json.dumps({"model": "core.TfarExport", "fields": self.export_fields("live.csv")}) + "\n")
+            fh.flush()
+
+            self.writer.record(TfarExport, **self.export_fields("mine.csv"))
+            self.writer.flush()
+
+        self.assertTrue(os.path.exists(live))
+        self.assertFalse(TfarExport.objects.filter(filename="live.csv").exists())
+
+    def test_locked_spool_name_falls_back_instead_of_blocking(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        taken = self.writer._spool_path()
+        with open(taken, "a", encoding="utf-8") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+
+            self.writer.record(TfarExport, **self.export_fields("a.csv"))
+
+            self.assertNotEqual(self.writer._spool.name, taken)
+
+    def test_spool_unlinked_before_lock_is_reopened(self):
+        # another process's orphan recovery deletes our freshly created, still unlocked spool
+        flock, calls = fcntl.flock, []
+
+        def flock_after_unlink(fh, op):
+            if not calls:
+                os.remove(fh.name)
+            calls.append(op)
+            return flock(fh, op)
+
+        with mock.patch("core.audit.fcntl.flock", side_effect=flock_after_unlink):
+            self.writer.record(TfarExport, **self.export_fields("a.csv"))
+
+        self.assertEqual(self.writer._spool.name, self.writer._spool_path())
+        self.assertEqual([e["fields"]["filename"] for e in self.spool_lines()], ["a.csv"])
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = get_user_model().objects.create_user("preparer", password="x")
+        self.acme = Client.objects.create(name="Acme")
+        ClientMembership.objects.create(user=self.user, client=self.acme)
+        self.client.force_login(self.user)
+
+    def record_queries(self, path):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [q["sql"] for q in ctx.captured_queries if "core_tfarrecord" in q["sql"]]
+
+    def upload_xlsx(self, asset_id):
+        wb = Workbook()
+        wb.active.append(REQUIRED_HEADERS)
+        wb.active.append([asset_id, "Laptop", datetime.date(2024, 7, 1), "DV", *[1] * 11])
+        buf = io.BytesIO()
+        wb.save(buf)
+        buf.name = "tfar.xlsx"
+        buf.seek(0)
+        return self.client.post("/upload/", {"client": str(self.acme.id), "file": buf})
+
+    def test_empty_client_shows_placeholder_row(self):
+        response = self.client.get("/")
+        self.assertContains(response, "No records for this client yet.", count=1)
+
+    def test_second_view_is_served_from_cache(self):
+        make_records(self.acme, self.user, ["ACME-1"])
+
+        self.assertTrue(self.record_queries("/"))
+        self.assertEqual(self.record_queries("/"), [])
+
+    def test_upload_bumps_version_and_rerenders(self):
+        make_records(self.acme, self.user, ["ACME-1"])
+        self.client.get("/")
+
+        self.assertRedirects(self.upload_xlsx("UPLOADED-1"), "/")
+
+        self.acme.refresh_from_db()
+        self.assertEqual(self.acme.data_version, 1)
+        self.assertContains(self.client.get("/"), "UPLOADED-1")
+
+    def test_admin_delete_bumps_version_and_rerenders(self):
+        make_records(self.acme, self.user, ["ACME-1", "ACME-2"])
+        self.assertContains(self.client.get("/"), "ACME-2")
+
+        record = TfarRecord.objects.get(asset_id="ACME-2")
+        self.client.force_login(get_user_model().objects.create_superuser("admin", "admin@example.com", "x"))
+        with PLAIN_STATIC:
+            self.client.post(f"/admin/core/tfarrecord/{record.pk}/delete/", {"post": "yes"})
+        self.client.force_login(self.user)
+
+        self.assertNotContains(self.client.get("/"), "ACME-2")
+
+    def test_page_past_the_end_is_404_and_not_cached(self):
+        self.client.get("/")
+
+        self.assertEqual(self.client.get("/?page=2").status_code, 404)
+        self.assertEqual(self.client.get("/?page=999999999999").status_code, 404)
+        self.assertIsNone(cache.get(f"tfar:dashboard:{self.acme.id}:v{self.acme.data_version}:p2"))
+
+    def test_switching_client_from_later_page_starts_at_page_one(self):
+        beta = Client.objects.create(name="Beta")
+        ClientMembership.objects.create(user=self.user, client=beta)
+        make_records(self.acme, self.user, ["ACME-1", "ACME-2", "ACME-3"])
+        make_records(beta, self.user, ["BETA-1"])
+
+        with mock.patch("core.views.DASHBOARD_PAGE_SIZE", 2):
+            self.assertContains(self.client.get("/?page=2"), 'action="/"')
+            response = self.client.post("/?page=2", {"client": str(beta.id)})
+
+        self.assertContains(response, "BETA-1")
+        self.assertEqual(response.context["page"], 1)
+
+
+class ExportBundleTests(TransactionTestCase):
+    """Worker threads use their own connections, so the data must be committed."""
+
+    def setUp(self):
+        spool_dir = tempfile.mkdtemp(prefix="tfar_audit_test_")
+        self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+        overrides = override_settings(AUDIT_SPOOL_DIR=spool_dir, AUDIT_FLUSH_INTERVAL=3600, TFAR_EXPORT_WORKERS=2)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(audit._writer.close)
+
+        self.user = get_user_model().objects.create_user("preparer", password="x")
+        self.acme = Client.objects.create(name="Acme")
+        self.beta_slash = Client.objects.create(name="Beta/Co")
+        self.beta = Client.objects.create(name="BetaCo")  # same file name as "Beta/Co"
+        make_records(self.acme, self.user, ["A2", "A1"], amount=10)
+        make_records(self.beta_slash, self.user, ["B1"], amount=5)
+        self.clients = [self.acme, self.beta_slash, self.beta]
+
+    def bundle(self):
+        data = b"".join(stream_export_bundle(self.clients, self.user, REQUIRED_HEADERS, "bundle.zip"))
+        return zipfile.ZipFile(io.BytesIO(data))
+
+    def test_bundle_contents(self):
+        zf = self.bundle()
+
+        self.assertIsNone(zf.testzip())
+        self.assertEqual(zf.namelist(), [
+            "Acme.csv", "Acme.xlsx", "BetaCo.csv", "BetaCo.xlsx",
+            f"BetaCo_{self.beta.id}.csv", f"BetaCo_{self.beta.id}.xlsx", "summary.xlsx",
+        ])
+
+        rows = list(csv.reader(io.StringIO(zf.read("Acme.csv").decode("utf-8"))))
+        self.assertEqual(rows[0], ["client"] + REQUIRED_HEADERS)
+        self.assertEqual(rows[1], ["Acme", "A1", "Laptop", "2024-07-01", "DV"] + ["10"] * 11)
+        self.assertEqual([r[1] for r in rows[1:]], ["A1", "A2"])
+        empty = list(csv.reader(io.StringIO(zf.read(f"BetaCo_{self.beta.id}.csv").decode("utf-8"))))
+        self.assertEqual(len(empty), 1)
+
+        from openpyxl import load_workbook
+        summary = list(load_workbook(io.BytesIO(zf.read("summary.xlsx"))).active.values)
+        self.assertEqual(summary[1:], [
+            ("Acme", 2, 20, 20, 20, "Acme.csv", "Acme.xlsx"),
+            ("Beta/Co", 1, 5, 5, 5, "BetaCo.csv", "BetaCo.xlsx"),
+            ("BetaCo", 0, 0, 0, 0, f"BetaCo_{self.beta.id}.csv", f"BetaCo_{self.beta.id}.xlsx"),
+            ("TOTAL", 3, 25, 25, 25, None, None),
+        ])
+
+    def test_one_audit_row_per_client(self):
+        self.bundle()
+        audit.flush()
+
+        self.assertEqual(
+            sorted(TfarExport.objects.values_list("client__name", "row_count", "exported_by__username")),
+            [("Acme", 2, "preparer"), ("Beta/Co", 1, "preparer"), ("BetaCo", 0, "preparer")],
+        )
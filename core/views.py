@@ -1,15 +1,23 @@
 
 # core/views.py
 import io, hashlib
-from typing import Any, List
-from openpyxl import load_workbook
-from openpyxl.cell.cell import Cell
+from typing import TYPE_CHECKING, Any, List
 
+if TYPE_CHECKING:  # openpyxl is imported lazily, only by views that parse/write workbooks
+    from openpyxl.cell.cell import Cell
+
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.utils import timezone
 
+from .audit import record_event
+from .exports import RECORD_FIELDS, stream_export_bundle
 from .forms import UploadForm, ClientSelectForm
 from .models import TfarRecord, Client, ClientMembership, TfarUpload, TfarExport
 
@@ -22,9 +30,11 @@ REQUIRED_HEADERS: List[str] = [
     "closing cost", "closing accumulated depreciation", "closing wdv",
 ]
 OPTIONAL_CLIENT_HEADER = "client"
+DASHBOARD_PAGE_SIZE = 2000
+DASHBOARD_MAX_PAGE = 100_000  # keeps OFFSET within range; real registers end far sooner
 
 
-def _cell_value(row: tuple[Cell | Any, ...], index: int) -> Any:
+def _cell_value(row: "tuple[Cell | Any, ...]", index: int) -> Any:
     try: return row[index]
     except Exception: return None
 
@@ -76,7 +86,7 @@ def dashboard(request):
     memberships = ClientMembership.objects.filter(user=request.user).select_related("client").order_by("client__name")
     if not memberships.exists():
         return render(request, "dashboard.html", {
-            "rows": [], "form": None, "client": None,
+            "form": None, "client": None,
             "error": "You are not assigned to any clients. Please ask an administrator to add you."
         })
 
@@ -86,14 +96,42 @@ def dashboard(request):
 
     client = get_object_or_404(Client, id=selected_client_id)
     if not memberships.filter(client=client).exists():
-        return render(request, "dashboard.html", {"rows": [], "form": ClientSelectForm(user=request.user),
+        return render(request, "dashboard.html", {"form": ClientSelectForm(user=request.user),
                                                   "error": "You don't have access to this client."})
 
-    # PERMISSIONS: show ALL records for the client (not only owner's)
-    rows = TfarRecord.objects.filter(client=client).order_by("-uploaded_at", "asset_id")[:2000]
+    # switching client starts at its first page, whatever page the form was posted from
+    try: page = 1 if request.method == "POST" else max(int(request.GET.get("page", 1)), 1)
+    except ValueError: page = 1
+    if page > DASHBOARD_MAX_PAGE:
+        raise Http404("No such page")
+    table_body, has_next = _dashboard_table(client, page)
 
     form = ClientSelectForm(user=request.user, data={"client": selected_client_id})
-    return render(request, "dashboard.html", {"rows": rows, "form": form, "client": client})
+    return render(request, "dashboard.html", {"table_body": table_body, "form": form, "client": client,
+                                              "page": page, "has_next": has_next})
+
+
+def _dashboard_table(client, page):
+    """
+    Rendered <tbody> rows for one client/page, cached until the client's
+    data_version is bumped (upload or admin change).
+    """
+    key = f"tfar:dashboard:{client.id}:v{client.data_version}:p{page}"
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    # PERMISSIONS: show ALL records for the client (not only owner's)
+    start = (page - 1) * DASHBOARD_PAGE_SIZE
+    rows = list(TfarRecord.objects.filter(client=client).order_by("-uploaded_at", "asset_id")
+                .values_list(*RECORD_FIELDS)[start:start + DASHBOARD_PAGE_SIZE + 1])
+    if not rows and page > 1:
+        # past the end: never cache, or ?page=N walks could fill the cache
+        raise Http404("No such page")
+    has_next = len(rows) > DASHBOARD_PAGE_SIZE
+    table_body = render_to_string("dashboard_rows.html", {"rows": rows[:DASHBOARD_PAGE_SIZE]})
+    cache.set(key, (table_body, has_next), settings.DASHBOARD_CACHE_TIMEOUT)
+    return table_body, has_next
 
 
 # ------------- Upload -------------
@@ -124,6 +162,7 @@ def upload_tfar(request):
         if membership.role != "preparer":
             return render(request, "upload.html", {"form": form, "error": "Upload not permitted for Reviewer role."})
 
+        from openpyxl import load_workbook
         try:
             wb = load_workbook(filename=uploaded, data_only=True); ws = wb.active
         except Exception as e:
@@ -185,18 +224,21 @@ def upload_tfar(request):
         except Exception as e:
             return render(request, "upload.html", {"form": form, "error": f"Unexpected error on row {row_num}: {e}"})
 
-        if records_to_create:
-            TfarRecord.objects.bulk_create(records_to_create, batch_size=1000)
-
-        # audit trail: insert one TfarUpload record
-        TfarUpload.objects.create(
-            client=client,
-            uploaded_by=request.user,
-            original_filename=uploaded.name,
-            row_count=len(records_to_create),
-            source_ip=_get_ip(request),
-            checksum=checksum,
-        )
+        with transaction.atomic():
+            # audit trail: insert one TfarUpload record; the rows link back to it
+            upload = TfarUpload.objects.create(
+                client=client,
+                uploaded_by=request.user,
+                original_filename=uploaded.name,
+                row_count=len(records_to_create),
+                source_ip=_get_ip(request),
+                checksum=checksum,
+            )
+            for rec in records_to_create:
+                rec.upload = upload
+            if records_to_create:
+                TfarRecord.objects.bulk_create(records_to_create, batch_size=1000)
+                Client.bump_data_version([client.id])
 
         request.session["selected_client_id"] = str(client.id)
         return redirect("dashboard")
@@ -224,7 +266,9 @@ def download_tfar_csv(request):
 
     out = io.StringIO()
     out.write(",".join(["client"] + REQUIRED_HEADERS) + "\n")
+    row_count = 0
     for r in qs:
+        row_count += 1
         out.write(",".join([
             client.name,
             r.asset_id, r.asset_description, r.tax_start_date.isoformat(), r.depreciation_method,
@@ -234,18 +278,36 @@ def download_tfar_csv(request):
             str(r.closing_accum_depreciation), str(r.closing_wdv),
         ]) + "\n")
 
-    # audit trail: log the export
-    TfarExport.objects.create(
-        client=client, exported_by=request.user, filename=filename, row_count=qs.count()
-    )
+    # audit trail: log the export (buffered, written in bulk off the request path)
+    record_event(TfarExport, client_id=client.id, exported_by_id=request.user.id,
+                 filename=filename, row_count=row_count)
 
     response = HttpResponse(out.getvalue(), content_type="text/csv")
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
 
 
+@login_required
+def download_tfar_bundle(request):
+    """
+    Stream a ZIP with the CSV and XLSX register of every client the user is a
+    member of, plus a summary sheet. Files are built in parallel workers.
+    """
+    clients = [m.client for m in ClientMembership.objects.filter(user=request.user)
+               .select_related("client").order_by("client__name")]
+    if not clients:
+        return HttpResponse("You are not assigned to any clients", status=403)
+
+    filename = f"tfar_export_bundle_{timezone.localdate():%Y%m%d}.zip"
+    response = StreamingHttpResponse(
+        stream_export_bundle(clients, request.user, REQUIRED_HEADERS, filename),
+        content_type="application/zip",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
 # -------- Diagnostics (optional) --------
-from django.conf import settings
 import json
 
 def env_view(request):
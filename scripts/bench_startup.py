@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Worker cold-start benchmark.
+
+    python scripts/bench_startup.py                 # in-process WSGI, 5 runs
+    python scripts/bench_startup.py --gunicorn      # real gunicorn worker over HTTP
+    python scripts/bench_startup.py --runs 10 --path /login/ --top 20
+
+Reports, per fresh interpreter:
+  * time-to-first-request: process spawn -> first response from `--path`
+  * import time of tfar1.wsgi + the URLconf/views (parsed from `-X importtime`),
+    with the slowest modules by cumulative time.
+"""
+import argparse, os, socket, statistics, subprocess, sys, time, urllib.error, urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fresh interpreter: load the WSGI app and serve one request without a network.
+CHILD = """
+import sys
+from tfar1.wsgi import application
+environ = {{
+    "REQUEST_METHOD": "GET", "PATH_INFO": {path!r}, "QUERY_STRING": "",
+    "SERVER_NAME": "localhost", "SERVER_PORT": "80", "HTTP_HOST": "localhost",
+    "wsgi.url_scheme": "http", "wsgi.input": sys.stdin.buffer, "wsgi.errors": sys.stderr,
+}}
+status = []
+body = b"".join(application(environ, lambda s, h, exc_info=None: status.append(s)))
+print(status[0])
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    env.setdefault("DJANGO_SETTINGS_MODULE", "tfar1.settings")
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def first_request_wsgi(path):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD.format(path=path)], cwd=ROOT, env=_env(),
+                         capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    return elapsed, out.stdout.strip()
+
+
+def first_request_gunicorn(path):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "tfar1.wsgi:application",
+                             "--bind", f"127.0.0.1:{port}", "--workers", "1"],
+                            cwd=ROOT, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as resp:
+                    return time.perf_counter() - start, str(resp.status)
+            except urllib.error.HTTPError as e:
+                return time.perf_counter() - start, str(e.code)
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError("gunicorn exited before serving a request")
+                time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def import_times(top):
+    """Parse `-X importtime` for the WSGI app plus the URLconf (which pulls in core.views)."""
+    code = "import tfar1.wsgi, django.urls; django.urls.get_resolver().url_patterns"
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=_env(),
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cum_us), name.rstrip()))
+    total = sum(r[0] for r in rows)
+    slowest = sorted(rows, key=lambda r: r[1], reverse=True)[:top]
+    return total, slowest, {r[2].strip() for r in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/login/", help="URL served as the first request")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--gunicorn", action="store_true", help="measure a real gunicorn worker over HTTP")
+    args = parser.parse_args()
+
+    measure = first_request_gunicorn if args.gunicorn else first_request_wsgi
+    times = []
+    for _ in range(args.runs):
+        elapsed, status = measure(args.path)
+        times.append(elapsed)
+    mode = "gunicorn" if args.gunicorn else "wsgi"
+    print(f"time-to-first-request ({mode}, GET {args.path} -> {status}, {args.runs} runs): "
+          f"min {min(times) * 1000:.0f} ms, median {statistics.median(times) * 1000:.0f} ms")
+
+    total, slowest, modules = import_times(args.top)
+    print(f"\nimport time (self, summed): {total / 1000:.0f} ms")
+    print(f"openpyxl imported at startup: {'yes' if 'openpyxl' in modules else 'no'}")
+    print(f"\n{'cumulative ms':>14}  module")
+    for _, cum_us, name in slowest:
+        print(f"{cum_us / 1000:>14.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -67,6 +67,28 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Parallel workers per consolidated (all clients) export bundle
+TFAR_EXPORT_WORKERS = int(os.getenv("TFAR_EXPORT_WORKERS", "4"))
+
+# Rendered dashboard tables, keyed on Client.data_version (per process).
+# A full 2000-row page is ~0.4-1 MB of HTML, so 30 entries caps this at
+# roughly 12-30 MB per gunicorn worker.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tfar1",
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "30"))},
+    }
+}
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv("DASHBOARD_CACHE_TIMEOUT", "3600"))
+
+# Buffered audit writer (core/audit.py): per-process spool files live here.
+# Must survive the process/container (see the VOLUME in the Dockerfile).
+AUDIT_SPOOL_DIR = os.getenv("AUDIT_SPOOL_DIR", str(BASE_DIR / "var" / "audit_spool"))
+AUDIT_FLUSH_SIZE = int(os.getenv("AUDIT_FLUSH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "2.0"))
+AUDIT_SPOOL_FSYNC = os.getenv("AUDIT_SPOOL_FSYNC", "False") == "True"
+
 
 LOGIN_URL = "/login/"
 LOGIN_REDIRECT_URL = "dashboard"
@@ -10,6 +10,7 @@ urlpatterns = [
     path("", views.dashboard, name="dashboard"),
     path("upload/", views.upload_tfar, name="upload_tfar"),
     path("download/", views.download_tfar_csv, name="download_tfar_csv"),
+    path("download/all/", views.download_tfar_bundle, name="download_tfar_bundle"),
     #path("debug/", views.debug_view),
     path("check/", views.safe_debug),
 ]